@@ -3,60 +3,99 @@
 Runs inside a machine/container that has MATLAB & Simulink installed.
 """
 import tempfile, json, subprocess, os, shutil
+from pathlib import Path
 import matlab.engine
 from schemas import Recipe
- 
+from tools._engine import TMP_ROOT, _TMP_RESOLVED, _q
+
+# name of an engine shared by a running MATLAB, e.g. started with
+#   matlab -nodesktop -r "matlab.engine.shareEngine('simmcp_executor')"
+SHARED_ENGINE = os.environ.get("SIMMCP_SHARED_ENGINE")
+
+
+class _Batch:
+    """MATLAB statements and results accumulated for one recipe."""
+    def __init__(self, mdl: str):
+        self.mdl = mdl
+        self.lines: list[str] = []
+        self.result: dict = {}
+
+
 class MCPExecutor:
     def __init__(self):
-        # Start MATLAB once; keep engine warm
-        self.eng = matlab.engine.start_matlab("-nodisplay -nosplash -nodesktop")
- 
+        # Attach to an already-warm shared engine if one is advertised,
+        # otherwise start MATLAB once and keep the engine warm
+        if SHARED_ENGINE and SHARED_ENGINE in matlab.engine.find_matlab():
+            self.eng = matlab.engine.connect_matlab(SHARED_ENGINE)
+        else:
+            self.eng = matlab.engine.start_matlab("-nodisplay -nosplash -nodesktop")
+
+        # one hidden figure, cleared and redrawn by every export
+        self.eng.eval("simmcp_fig = figure('Visible', 'off');", nargout=0)
+
+        self._dispatch = {
+            "add_block": self._do_add_block,
+            "add_line": self._do_add_line,
+            "set_param": self._do_set_param,
+            "sim": self._do_sim,
+            "export": self._do_export,
+        }
+
     def execute(self, recipe: Recipe) -> dict:
+        # Every op is rendered into one MATLAB script and sent in a single
+        # eval, so a recipe costs one Engine round trip instead of one per op.
         mdl = recipe.modelName
-        eng = self.eng
-        eng.eval(f"new_system('{mdl}'); open_system('{mdl}')", nargout=0)
- 
+        batch = _Batch(mdl)
+        # reuse the open diagram if there is one, just clear it for the new ops
+        batch.lines.append(
+            f"if bdIsLoaded({_q(mdl)}); Simulink.BlockDiagram.deleteContents({_q(mdl)}); "
+            f"else; new_system({_q(mdl)}); end; open_system({_q(mdl)});")
+
+        dispatch = self._dispatch
         for op in recipe.ops:
-            match op.cmd:
-                case "add_block":
-                    dest = f"{mdl}/{op.name}"
-                    eng.add_block(op.block, dest, nargout=0)
-    
-                    # convert to Matlab numeric vector
-                    if op.position:
-                        eng.set_param(dest, "Position",
-                                    matlab.double(op.position), nargout=0)
-                    if op.value:
-                        eng.set_param(dest, "Value", op.value, nargout=0)
- 
-                case "add_line":
-                    eng.add_line(mdl, op.src, op.dst, nargout=0)
- 
-                case "set_param":
-                    eng.set_param(f"{mdl}/{op.target}", *sum(op.params.items(), ()), nargout=0)
- 
-                case "sim":
-                    simout = eng.sim(
-                        mdl,
-                        "StopTime", op.stopTime,
-                        "SaveTime",   "on",
-                        "SaveOutput", "on",
-                        "SaveFormat", "Array",          # ← key line
-                        "ReturnWorkspaceOutputs", "on",
-                        nargout=1)
-                
-                    self.tout = eng.get(simout, 'tout', nargout=1)
-                    self.yout = eng.get(simout, 'yout', nargout=1)
- 
-                case "export":
-                    fig = eng.figure(nargout=1)
-                    eng.plot(self.tout, self.yout, nargout=0)
-                    eng.xlabel("Time (s)", nargout=0)
-                    eng.ylabel(op.signal, nargout=0)
-                    tmp_png = os.path.join(tempfile.gettempdir(), op.filename)
-                    eng.exportgraphics(fig, tmp_png, nargout=0)
+            dispatch[op.cmd](op, batch)
+
+        self.eng.eval("\n".join(batch.lines), nargout=0)
+        return batch.result
+
+    def _do_add_block(self, op, batch: _Batch):
+        dest = _q(f"{batch.mdl}/{op.name}")
+        args = f"{_q(op.block)}, {dest}"
+        if op.position:
+            args += f", 'Position', {op.position_literal}"
+        batch.lines.append(f"add_block({args});")
+        if op.value:
+            batch.lines.append(f"set_param({dest}, 'Value', {_q(op.value)});")
+
+    def _do_add_line(self, op, batch: _Batch):
+        batch.lines.append(
+            f"add_line({_q(batch.mdl)}, {_q(op.src)}, {_q(op.dst)});")
+
+    def _do_set_param(self, op, batch: _Batch):
+        if op.params:
+            kv = ", ".join(f"{_q(k)}, {_q(v)}" for k, v in op.params.items())
+            batch.lines.append(
+                f"set_param({_q(f'{batch.mdl}/{op.target}')}, {kv});")
+
+    def _do_sim(self, op, batch: _Batch):
+        batch.lines.append(
+            f"simout = sim({_q(batch.mdl)}, 'StopTime', {_q(op.stopTime)}, "
+            "'SaveTime', 'on', 'SaveOutput', 'on', "
+            "'SaveFormat', 'Array', "          # ← key line
+            "'ReturnWorkspaceOutputs', 'on');")
+        batch.lines.append("tout = simout.tout; yout = simout.yout;")
+
+    def _do_export(self, op, batch: _Batch):
+        tmp_png = os.path.join(TMP_ROOT, op.filename)
+        if not Path(tmp_png).resolve().is_relative_to(_TMP_RESOLVED):
+            raise ValueError(f"export filename escapes {TMP_ROOT}: {op.filename}")
+        batch.lines.append(
+            "if ~isgraphics(simmcp_fig); simmcp_fig = figure('Visible', 'off'); end; "
+            "clf(simmcp_fig); ax = axes(simmcp_fig); plot(ax, tout, yout); "
+            f"xlabel(ax, 'Time (s)'); ylabel(ax, {_q(op.signal)}); "
+            f"exportgraphics(simmcp_fig, {_q(tmp_png)});")
         # For the demo, return local path; replace by S3 URL in prod
-        return {"image_path": tmp_png}
- 
+        batch.result["image_path"] = tmp_png
+
 # singleton
-EXECUTOR = MCPExecutor()
\ No newline at end of file
+EXECUTOR = MCPExecutor()
@@ -1,27 +1,87 @@
+import asyncio, hashlib, os, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from schemas import Recipe
 from planner import nl_to_recipe
-from executor import EXECUTOR
+from executor import EXECUTOR, TMP_ROOT
  
 app = FastAPI(title="MCP demo")
+
+# One worker per MATLAB engine. EXECUTOR drives a single engine, so recipes
+# queue here instead of tying up FastAPI's shared threadpool while they run.
+MATLAB_EXEC = ThreadPoolExecutor(max_workers=1, thread_name_prefix="matlab")
+
+# recipe hash → (expiry, result); results of deterministic recipes only
+CACHE_SIZE = int(os.environ.get("SIMMCP_CACHE_SIZE", "64"))
+CACHE_TTL = float(os.environ.get("SIMMCP_CACHE_TTL", "3600"))
+CACHE_DIR = os.path.join(TMP_ROOT, "simmcp_cache")
+_CACHE: OrderedDict[str, tuple[float, dict]] = OrderedDict()
  
 class NLRequest(BaseModel):
     prompt: str
+
+
+def _recipe_key(recipe: Recipe) -> str:
+    return hashlib.blake2b(recipe.model_dump_json().encode()).hexdigest()
+
+
+def _cache_get(key: str) -> dict | None:
+    hit = _CACHE.get(key)
+    if hit is None:
+        return None
+    expires, result = hit
+    path = result.get("image_path")
+    if expires < time.monotonic() or (path and not os.path.exists(path)):
+        _cache_drop(key)
+        return None
+    _CACHE.move_to_end(key)
+    return result
+
+
+def _cache_put(key: str, result: dict) -> dict:
+    # Move the image under a private name: the next recipe may export to
+    # the same filename. Same tmpfs, so this is a rename, not a copy.
+    if "image_path" in result:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        cached = os.path.join(CACHE_DIR, f"{key}.png")
+        os.replace(result["image_path"], cached)
+        result = {**result, "image_path": cached}
+    _CACHE[key] = (time.monotonic() + CACHE_TTL, result)
+    while len(_CACHE) > CACHE_SIZE:
+        _cache_drop(next(iter(_CACHE)))
+    return result
+
+
+def _cache_drop(key: str):
+    _, result = _CACHE.pop(key)
+    if "image_path" in result and os.path.exists(result["image_path"]):
+        os.remove(result["image_path"])
+
  
 @app.post("/simulate")
-def simulate(req: NLRequest):
+async def simulate(req: NLRequest):
     try:
         recipe: Recipe = nl_to_recipe(req.prompt.lower())
     except Exception as e:
         raise HTTPException(400, f"Planner error: {e}")
+
+    # SIMMCP_CACHE_SIZE=0 turns the cache off
+    key = _recipe_key(recipe) if recipe.cacheable and CACHE_SIZE > 0 else None
+    if key is not None and (cached := _cache_get(key)) is not None:
+        return {"status": "ok", **cached}
  
     try:
-        result = EXECUTOR.execute(recipe)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(MATLAB_EXEC, EXECUTOR.execute, recipe)
     except Exception as e:
         raise HTTPException(500, f"Execution error: {e}")
+
+    if key is not None:
+        result = _cache_put(key, result)
  
     return {
         "status": "ok",
         **result
-    }
\ No newline at end of file
+    }
@@ -2,15 +2,34 @@
 Very thin “planner”: maps key phrases to canned recipes.
 Swap for an LLM or proper prompt/grammar later.
 """
-import json, pathlib
+import pathlib
+import ahocorasick
+import orjson
 from schemas import Recipe
- 
+
 TEMPLATE_DIR = pathlib.Path(__file__).with_suffix('').parent / "templates"
- 
+
+# templates are static: read + validate once at import
+_TEMPLATES = {
+    "msd": Recipe.model_validate(
+        orjson.loads((TEMPLATE_DIR / "msd.json").read_bytes())),
+}
+
+# template → keywords that must all appear in the request
+_RULES = {
+    "msd": {"mass", "spring"},
+}
+
+# one automaton over every keyword: a single linear pass per request,
+# however many templates there are
+_MATCHER = ahocorasick.Automaton()
+for _kw in set().union(*_RULES.values()):
+    _MATCHER.add_word(_kw, _kw)
+_MATCHER.make_automaton()
+
 def nl_to_recipe(user_request: str) -> Recipe:
-    # naïve match
-    if "mass" in user_request and "spring" in user_request:
-        with open(TEMPLATE_DIR / "msd.json") as fp:
-            data = json.load(fp)
-        return Recipe.model_validate(data)
-    raise ValueError("unsupported request")
\ No newline at end of file
+    seen = {kw for _, kw in _MATCHER.iter(user_request)}
+    for name, required in _RULES.items():
+        if required <= seen:
+            return _TEMPLATES[name].model_copy()
+    raise ValueError("unsupported request")
@@ -0,0 +1,10 @@
+function simmcp_add_block(src, dst, left, top, right, bottom, value)
+%SIMMCP_ADD_BLOCK Add a block at the given position and optionally set its Value.
+%   Called by SimulinkSession.add_block; one Engine call per block. The
+%   position comes in as four scalars, which need no matlab.double on the
+%   Python side.
+add_block(src, dst, 'Position', [left, top, right, bottom]);
+if nargin > 6
+    set_param(dst, 'Value', value);
+end
+end
@@ -0,0 +1,18 @@
+function simmcp_plot(simout, ylab, path)
+%SIMMCP_PLOT Plot a sim result into a hidden, reused figure and export it.
+%   Uses tout/yout; models without root Outports fall back to the first
+%   signal in logsout.
+persistent fig
+try
+    t = simout.tout; y = simout.yout; assert(~isempty(y));
+catch
+    v = simout.logsout.get(1).Values; t = v.Time; y = v.Data;
+end
+if isempty(fig) || ~isgraphics(fig)
+    fig = figure('Visible', 'off');
+end
+clf(fig); ax = axes(fig);
+plot(ax, t, y);
+xlabel(ax, 'Time (s)'); ylabel(ax, ylab);
+exportgraphics(fig, path);
+end
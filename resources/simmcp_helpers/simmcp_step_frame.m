@@ -0,0 +1,10 @@
+function isDone = simmcp_step_frame(scene, trajectory, platform, ax, t)
+%SIMMCP_STEP_FRAME Advance the UAV scene one frame and redraw it.
+%   Moves PLATFORM to its pose on TRAJECTORY at time T and points the
+%   camera of AX at it.
+isDone = advance(scene);
+motionInfo = query(trajectory, t);
+move(platform, motionInfo);
+camtarget(ax, [motionInfo(2), motionInfo(1), -motionInfo(3)]);   % NED -> ENU
+drawnow limitrate;
+end
@@ -1,7 +1,18 @@
-from pydantic import BaseModel, Field, conlist, constr
-from typing import List, Dict, Literal, Optional
+import re
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, field_validator
+from typing import Any, Dict, Literal, Optional
+
+_STOP_RE = re.compile(r"\d+(?:\.\d+)?")
+# random sources: Random Number / Uniform Random Number / Band-Limited White
+# Noise blocks, and rand/randn/randi in parameter expressions
+_RANDOM_RE = re.compile(r"random|noise|\brand[ni]?\b", re.IGNORECASE)
  
 class OpBase(BaseModel):
+    # recipes are reused from planner templates; frozen models with tuple
+    # fields keep a shared template from being changed through a copy
+    # (params dicts are only ever read)
+    model_config = ConfigDict(frozen=True)
+
     cmd: Literal[
         "new_system", "add_block", "add_line",
         "set_param", "sim", "export"]
@@ -10,8 +21,19 @@ class AddBlockOp(OpBase):
     cmd: Literal["add_block"]
     block: str    
     name: str    
-    position: conlist(int, min_length=4, max_length=4)
+    position: tuple[int, int, int, int]
     value: Optional[str] = None
+
+    # MATLAB row-vector literal for `position`, rendered once at validation
+    # so template ops never re-format it per execute
+    _position_literal: str = PrivateAttr(default="")
+
+    def model_post_init(self, __context: Any) -> None:
+        self._position_literal = f"[{','.join(map(str, self.position))}]"
+
+    @property
+    def position_literal(self) -> str:
+        return self._position_literal
  
 class AddLineOp(OpBase):
     cmd: Literal["add_line"]
@@ -25,7 +47,14 @@ class SetParamOp(OpBase):
  
 class SimOp(OpBase):
     cmd: Literal["sim"]
-    stopTime: constr(pattern=r"^\d+(\.\d+)?$")
+    stopTime: str
+
+    @field_validator("stopTime")
+    @classmethod
+    def _check_stop_time(cls, v: str) -> str:
+        if not _STOP_RE.fullmatch(v):
+            raise ValueError("stopTime must be a non-negative number")
+        return v
  
 class ExportOp(OpBase):
     cmd: Literal["export"]
@@ -35,5 +64,27 @@ class ExportOp(OpBase):
 Op = AddBlockOp | AddLineOp | SetParamOp | SimOp | ExportOp
  
 class Recipe(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     modelName: str    
-    ops: List[Op]
\ No newline at end of file
+    ops: tuple[Op, ...]
+    # False if the model depends on randomness; such results are never cached.
+    # Random blocks and rand* expressions are detected at validation, so this
+    # only needs setting for randomness the scan cannot see.
+    deterministic: bool = True
+
+    _random: bool = PrivateAttr(default=False)
+
+    def model_post_init(self, __context: Any) -> None:
+        texts = []
+        for op in self.ops:
+            if isinstance(op, AddBlockOp):
+                texts += [op.block, op.value or ""]
+            elif isinstance(op, SetParamOp):
+                texts += op.params.values()
+        self._random = any(_RANDOM_RE.search(t) for t in texts)
+
+    @property
+    def cacheable(self) -> bool:
+        """True if running the recipe twice gives the same result."""
+        return self.deterministic and not self._random
\ No newline at end of file
@@ -1,12 +1,40 @@
 # sim_chat.py ──────────────────────────────────────────────────────────────
-import os, json, base64, tempfile, subprocess, webbrowser, textwrap
+import os, base64, tempfile, subprocess, webbrowser, textwrap, atexit
 from pathlib import Path
 from typing import Any
-import openai, fastmcp                                     # pip install …
+import openai, fastmcp, orjson                             # pip install …
 
 # ── 1  Launch MCP server over stdio ───────────────────────────────────────
 SERVER = ["fastmcp", "run", "simulink_server.py", "--stdio"]
-mcp = fastmcp.MCPClient.open_stdio(SERVER)
+
+class PersistentMCP:
+    """One stdio client kept alive for the whole chat, so tool calls never
+    pay the subprocess spawn + MCP handshake again."""
+
+    def __init__(self, server: list[str]):
+        self.server = server
+        self._client = None
+
+    def connect(self) -> "fastmcp.MCPClient":
+        if self._client is None:
+            self._client = fastmcp.MCPClient.open_stdio(self.server)
+        return self._client
+
+    def disconnect(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def list_tools(self):
+        return self.connect().list_tools()
+
+    def call(self, name: str, payload: dict[str, Any]):
+        res = self.connect().call(name, payload)
+        tool_result_hook(res)
+        return res
+
+mcp = PersistentMCP(SERVER)
+atexit.register(mcp.disconnect)
 
 # ── 2  Convert MCP tools → OpenAI function-schema list ────────────────────
 def tool_to_schema(t: fastmcp.Tool) -> dict[str, Any]:
@@ -17,8 +45,12 @@ OAI_FUNCS = [tool_to_schema(t) for t in mcp.list_tools()]
 
 # helper to execute tool calls
 def call_tool(name: str, args: dict[str, Any]) -> str:
-    result = getattr(mcp, name)(**args)
-    return json.dumps(result)
+    if name == "export_plot":
+        # tool results go back to the chat model as JSON text, so ask for
+        # the base64 dict rather than MCP image content
+        args.setdefault("args", {})["encoding"] = "base64"
+    result = mcp.call(name, args)
+    return orjson.dumps(result).decode()
 
 # ── 3  Chat wrapper with function-calling loop ────────────────────────────
 def ask_system(prompt: str):
@@ -38,7 +70,7 @@ def ask_system(prompt: str):
         if msg.get("tool_calls"):
             for call in msg.tool_calls:
                 name = call.function.name
-                args = json.loads(call.function.arguments or "{}")
+                args = orjson.loads(call.function.arguments or "{}")
                 print(f"\n→ {name}({args})")
                 result = call_tool(name, args)
                 msgs.append({
@@ -54,7 +86,7 @@ def ask_system(prompt: str):
 # ── 4  Pretty-print images returned as base-64 ────────────────────────────
 def tool_result_hook(result_json: str):
     try:
-        data = json.loads(result_json)
+        data = orjson.loads(result_json)
         if isinstance(data, dict) and "content" in data:
             fn = Path(tempfile.gettempdir()) / data.get("filename", "tmp.png")
             fn.write_bytes(base64.b64decode(data["content"]))
@@ -63,14 +95,6 @@ def tool_result_hook(result_json: str):
     except Exception:
         pass
 
-# monkey-patch MCPClient → intercept every tool response
-old_call = fastmcp.MCPClient.call
-def new_call(self, name, payload):
-    res = old_call(self, name, payload)
-    tool_result_hook(res)
-    return res
-fastmcp.MCPClient.call = new_call
-
 # ── 5  Run from CLI argument or REPL ──────────────────────────────────────
 if __name__ == "__main__":
     import sys
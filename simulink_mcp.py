@@ -5,16 +5,29 @@ from fastmcp import FastMCP, Context
 
 from tools.core_tools.functions import *
 from tools.uav_tools.functions import *
-import json
+import orjson
+import atexit
+import functools
+import queue
 
 import logging
+from logging.handlers import QueueHandler, QueueListener
+
+# Configure the logging: request threads only enqueue records, a listener
+# thread does the formatting and the synchronous file writes
+_log_queue: queue.Queue = queue.Queue(-1)
+_file_handler = logging.FileHandler('app.log')                  # Log file name
+_file_handler.setFormatter(
+    logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))  # Log format
+_log_listener = QueueListener(_log_queue, _file_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 
-# Configure the logging
 logging.basicConfig(
-    filename='app.log',           # Log file name
     level=logging.INFO,           # Logging level
-    format='%(asctime)s - %(levelname)s - %(message)s'  # Log format
+    handlers=[QueueHandler(_log_queue)]
 )
+logger = logging.getLogger(__name__)
 
 # ──────────────────────────────────────────────────────────────────────
 # Fast-MCP host
@@ -22,6 +35,15 @@ logging.basicConfig(
 mcp = FastMCP("Simulink Toolbox (iterative)")
 
 RES_DIR = Path(__file__).parent / "resources"
+JSON_PATH = RES_DIR / "SimulinkCore/core_blocks.json"
+
+
+@functools.lru_cache(maxsize=16)
+def _load_json(path: str, mtime_ns: int, size: int) -> dict:
+    # keyed on (path, mtime, size): repeat fetches are served from memory,
+    # an edited file is re-parsed on its next fetch
+    return orjson.loads(Path(path).read_bytes())
+
 
 # ────────────────────────────────────────────────────────────────
 # ⬦ 2. dynamic resource template
@@ -32,12 +54,11 @@ def get_simulink_blocks_json() -> dict:
     """
     Serve the entire Simulink blocks JSON data as a resource.
     """
-
-    JSON_PATH = Path(__file__).parent / "resources/SimulinkCore/core_blocks.json"
-    with open(JSON_PATH, "r", encoding="utf-8") as f:
-        SIMULINK_BLOCKS_DATA = json.load(f)
-    logging.info(SIMULINK_BLOCKS_DATA);
-    return SIMULINK_BLOCKS_DATA
+    st = JSON_PATH.stat()
+    blocks = _load_json(str(JSON_PATH), st.st_mtime_ns, st.st_size)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("served %d blocks", len(blocks))
+    return blocks
 
 
 mcp.tool(name="new_model",
@@ -54,6 +75,10 @@ mcp.tool(name="export_plot",
          description="Generate a PNG plot of the main output signal.")(export_plot)
 mcp.tool(name="close_session",
          description="Close the MATLAB session and free resources.")(close_session)
+mcp.tool(name="batch_execute",
+         description="Run a list of {tool, args} calls (add_block, add_line, "
+                     "set_param, sim, export_plot, close_session) in one "
+                     "request.")(batch_execute)
 
 mcp.tool()(start_matlab_engine)
 mcp.tool()(create_uav_scenario)
@@ -70,6 +95,7 @@ mcp.tool()(query_trajectory)
 mcp.tool()(move_platform)
 mcp.tool()(update_camera_target)
 mcp.tool()(drawnow_limitrate)
+mcp.tool()(step_frame)
 # ──────────────────────────────────────────────────────────────────────
 
 
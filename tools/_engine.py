@@ -0,0 +1,171 @@
+# Pre-warmed MATLAB engine pool and helpers shared by the Simulink and UAV
+# sessions and the recipe executor
+
+from pathlib import Path
+import os
+import queue
+import tempfile
+import threading
+import weakref
+import matlab.engine
+
+# plot exports are read straight back, so keep them in RAM where tmpfs exists
+TMP_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+_TMP_RESOLVED = Path(TMP_ROOT).resolve()
+
+# MATLAB helper functions, put on an engine's path once per session;
+# MATLAB parses each file once and caches it
+HELPER_DIR = Path(__file__).resolve().parents[1] / "resources" / "simmcp_helpers"
+
+POOL_SIZE = int(os.environ.get("SIMMCP_POOL_SIZE", "2"))
+MATLAB_FLAGS = "-nosplash"
+
+# Engines shared by already-running MATLAB processes, e.g. started with
+#   matlab -nodesktop -r "matlab.engine.shareEngine('simmcp_session_1')"
+# Connecting to one takes ~100 ms instead of a full cold start. Names are
+# taken while connected and put back when the connection is dropped.
+_SHARED = [n for n in os.environ.get("SIMMCP_SHARED_ENGINES", "").split(",") if n]
+_ANY_SHARED = bool(_SHARED)
+# connection futures -> shared engine name, for names dropped before use
+_CONNECTING: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+# idle engines, or FutureResults of engines that are still starting up
+_POOL: queue.Queue = queue.Queue()
+
+# engines owned by this process: idle, checked out or still starting
+_live = 0
+_warmed = False
+_lock = threading.Lock()
+
+
+def _spawn():
+    """Connect a free shared engine, else start one; both in the background."""
+    global _live
+    with _lock:
+        live = set(matlab.engine.find_matlab()) if _SHARED else set()
+        name = next((n for n in _SHARED if n in live), None)
+        if name is not None:
+            _SHARED.remove(name)
+        _live += 1
+    if name is not None:
+        fut = matlab.engine.connect_matlab(name, background=True)
+        _CONNECTING[fut] = name
+        return fut
+    # background=True returns immediately; startup overlaps with other work
+    return matlab.engine.start_matlab(MATLAB_FLAGS, background=True)
+
+
+def warm_pool():
+    """Start POOL_SIZE engines in the background; later calls do nothing."""
+    global _warmed
+    with _lock:
+        if _warmed:
+            return
+        _warmed = True
+    for _ in range(POOL_SIZE):
+        _POOL.put(_spawn())
+
+
+def _q(s) -> str:
+    """Quote *s* as a MATLAB char literal."""
+    return "'" + str(s).replace("'", "''") + "'"
+
+
+def resolve(eng):
+    """Wait for *eng* if it is still a FutureResult; return the engine."""
+    if isinstance(eng, matlab.engine.FutureResult):
+        return eng.result()
+    return eng
+
+
+def get_engine():
+    """Return an idle engine, or a FutureResult of one still starting up."""
+    try:
+        return _POOL.get_nowait()
+    except queue.Empty:
+        # every pooled engine is in use: start an extra one, which is
+        # dropped again on release
+        return _spawn()
+
+
+def release_engine(eng):
+    """Reset *eng* and return it to the pool, or drop it if the pool is full."""
+    global _live
+    with _lock:
+        extra = _live > POOL_SIZE
+        if extra:
+            _live -= 1
+    if extra:
+        _drop(eng)
+        return
+    if isinstance(eng, matlab.engine.FutureResult):
+        if not _failed(eng):
+            _POOL.put(eng)      # never used, nothing to reset
+            return
+    else:
+        try:
+            eng.eval("close('all', 'force'); bdclose('all'); clear all", nargout=0)
+        except (matlab.engine.EngineError, matlab.engine.RejectedExecutionError):
+            pass                # engine died
+        except matlab.engine.MatlabExecutionError:
+            _quit(eng)          # alive but could not be reset; don't reuse it
+        else:
+            _POOL.put(eng)
+            return
+    # start a replacement in its place
+    with _lock:
+        _live -= 1
+    _POOL.put(_spawn())
+
+
+def discard_engine(eng):
+    """Drop *eng* instead of pooling it; a fresh engine takes its slot."""
+    global _live
+    with _lock:
+        extra = _live > POOL_SIZE
+        _live -= 1
+    _drop(eng)
+    if not extra:
+        _POOL.put(_spawn())
+
+
+def _failed(fut) -> bool:
+    """True if *fut* finished starting up with an error."""
+    if not fut.done():
+        return False
+    try:
+        fut.result()
+    except Exception:
+        return True
+    return False
+
+
+def _quit(eng):
+    try:
+        eng.quit()
+    except (matlab.engine.EngineError, matlab.engine.RejectedExecutionError):
+        pass
+
+
+def _drop(eng):
+    name = ""
+    if isinstance(eng, matlab.engine.FutureResult):
+        name = _CONNECTING.pop(eng, "")
+        if eng.cancel() or _failed(eng):
+            _requeue(name)
+            return
+        eng = eng.result()
+    if _ANY_SHARED and not name:
+        try:
+            name = eng.eval("matlab.engine.engineName", nargout=1)
+        except (matlab.engine.EngineError, matlab.engine.RejectedExecutionError):
+            pass
+    # for a shared engine this only disconnects; the MATLAB process stays up
+    _quit(eng)
+    _requeue(name)
+
+
+def _requeue(name):
+    if name:
+        with _lock:
+            _SHARED.append(name)
@@ -1,87 +1,293 @@
-from pydantic import BaseModel, Field, constr
+from fastmcp.utilities.types import Image
+from pydantic import BaseModel, Field, conlist, field_validator
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from pathlib import Path
+from typing import Any, Literal
+import base64
+import hashlib
 import os
+import re
+import shutil
+import sys
+import threading
 import tempfile
 import uuid
 import matlab
 import matlab.engine
+import orjson
+from tools._engine import (HELPER_DIR, TMP_ROOT, _q, get_engine, release_engine,
+                           resolve, warm_pool)
+
+warm_pool()
+
+# simulation results (out.mat + plots), keyed by a hash of the model build;
+# at most CACHE_ENTRIES results are kept, least recently used go first;
+# SIMMCP_CACHE_ENTRIES=0 turns the cache off
+CACHE_DIR = Path(os.environ.get("SIMMCP_CACHE_DIR",
+                                Path.home() / "SimMCP-models" / "cache"))
+CACHE_ENTRIES = int(os.environ.get("SIMMCP_CACHE_ENTRIES", "256"))
+
+# MATLAB release, part of every cache key so an upgrade never reuses results
+_matlab_version: str | None = None
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return 0.0      # pruned by another session meanwhile
+
+
+def _prune_cache(keep: str):
+    entries = sorted((p for p in CACHE_DIR.iterdir() if p.name != keep),
+                     key=_mtime)
+    # the kept entry counts towards the limit
+    for old in entries[:max(len(entries) + 1 - CACHE_ENTRIES, 0)]:
+        shutil.rmtree(old, ignore_errors=True)
 
 
 class SimulinkSession:
     def __init__(self):
         self.mdl = f"job_{uuid.uuid4().hex[:8]}"
-        # self.eng   = matlab.engine.start_matlab(
-        #     "-nodisplay -nosplash -nodesktop")
-        self.eng = matlab.engine.start_matlab(
-            "-nosplash")
-        self.eng.new_system(self.mdl, nargout=0)
+        # may still be starting; new_model returns without waiting for it
+        self._starting = get_engine()
+        self._eng = None
+        # Engine calls issued with background=True and not yet confirmed.
+        # MATLAB runs them in order; errors surface at the next _sync().
+        self._pending = []
+        # Python-side mirror of the root-level block names, so add_block
+        # needs no find_system round trips. Only add_block adds blocks;
+        # after a failed MATLAB call the mirror is rebuilt from the model.
+        self._names: set[str] = set()
+        self._n = 0
+        self._sim_configured = False    # save options set on the model
+        # Every build step in call order; its hash addresses the result
+        # cache. None once a MATLAB call has failed, as the model may then
+        # differ from the record.
+        self._record: list | None = []
+        self._sim_key: str | None = None
+
+    @property
+    def eng(self):
+        # first real use waits for startup and creates the model
+        if self._eng is None:
+            eng = resolve(self._starting)
+            eng.eval(f"addpath({_q(HELPER_DIR)}); new_system({_q(self.mdl)});",
+                     nargout=0)
+            self._eng = eng
+        return self._eng
+
+    def _sync(self, rebuild=True):
+        pending, self._pending = self._pending, []
+        try:
+            for fut in pending:
+                fut.result()
+        except matlab.engine.MatlabExecutionError:
+            self._record = None
+            if rebuild:
+                self._rebuild_names()
+            raise
+
+    def _rebuild_names(self):
+        names = self.eng.eval(
+            f"get_param(find_system({_q(self.mdl)}, 'SearchDepth', 1, "
+            "'Type', 'block'), 'Name')", nargout=1)
+        self._names = set(names)
+        self._n = len(self._names)
+
+    def _log(self, *step):
+        if self._record is not None:
+            self._record.append(step)
 
     # low-level helpers
+    # Multi-step operations go through one helper function (or one statement
+    # string), so each costs a single Engine round trip.
     def add_block(self, block_path, name, position=None, value=None):
-        dest = f"{self.mdl}/{name}"
-        self.eng.add_block(block_path, dest, nargout=0)
-        if position:
-            self.eng.set_param(dest, "Position",
-                               matlab.double(position), nargout=0)
+        if name in self._names:
+            raise ValueError(f"Block name '{name}' already exists.")
+        # auto-grid position if none supplied
+        if not position:
+            position = [40 + 80*self._n, 40, 80 + 80*self._n, 90]
+
+        # Python floats arrive as MATLAB doubles; no matlab.double to build
+        args = [block_path, f"{self.mdl}/{name}", *map(float, position)]
         if value is not None:
-            self.eng.set_param(dest, "Value", str(value), nargout=0)
+            args.append(str(value))
+        self._pending.append(self.eng.simmcp_add_block(
+            *args, nargout=0, background=True))
+        self._names.add(name)
+        self._n += 1
+        self._log("add_block", block_path, name, list(position), value)
 
     def add_line(self, src, dst):
+        self._sync()    # both ends must exist
         self.eng.add_line(self.mdl, src, dst, nargout=0)
+        self._log("add_line", src, dst)
 
     def set_param(self, target, params: dict[str, str]):
-        kv = sum(params.items(), ())
-        self.eng.set_param(f"{self.mdl}/{target}", *kv, nargout=0)
+        # checked against the name mirror; no find_system round trip
+        if target.split("/", 1)[0] not in self._names:
+            raise ValueError(f"Block '{target}' does not exist.")
+        # flatten {'Param': val, ...} -> ('Param', 'val', ...); MATLAB wants chars
+        kv = tuple(chain.from_iterable((k, str(v)) for k, v in params.items()))
+        self._pending.append(
+            self.eng.set_param(f"{self.mdl}/{target}", *kv,
+                               nargout=0, background=True))
+        self._log("set_param", target, kv)
 
     def sim(self, stop_time: str):
-        self.eng.set_param(self.mdl,
-                           "SaveTime", "on", "SaveOutput", "on",
-                           "SaveFormat", "Array",
-                           nargout=0)
-        self.simout = self.eng.sim(
-            self.mdl, "StopTime", stop_time,
-            "ReturnWorkspaceOutputs", "on",
-            nargout=1)
-
-    def export_plot(self, signal, filename):
-        tout = self.eng.get(self.simout, 'tout', nargout=1)
-        yout = self.eng.get(self.simout, 'yout', nargout=1)
-        fig = self.eng.figure(nargout=1)
-        self.eng.plot(tout, yout, nargout=0)
-        self.eng.xlabel("Time (s)", nargout=0)
-        self.eng.ylabel(signal,    nargout=0)
-
-        fname = filename or "result.png"
-        path = os.path.join(tempfile.gettempdir(), fname)
-        self.eng.exportgraphics(fig, path, nargout=0)
-        return path
+        self._sync()
+        self._sim_key = None
+        key = None
+        if self._record is not None and CACHE_ENTRIES > 0:
+            global _matlab_version
+            if _matlab_version is None:
+                _matlab_version = self.eng.version(nargout=1)
+            key = hashlib.blake2b(orjson.dumps(
+                [_matlab_version, *self._record, ("sim", stop_time)])).hexdigest()
+            mat = CACHE_DIR / key / "out.mat"
+            try:
+                os.utime(mat.parent)    # mark as recently used
+                hit = mat.exists()
+            except FileNotFoundError:
+                hit = False
+            if hit:
+                # same model, same stop time: reuse the stored result
+                self.eng.eval(f"load({_q(mat)}, 'simout_');", nargout=0)
+                self._sim_key = key
+                return
+            mat.parent.mkdir(parents=True, exist_ok=True)
+
+        mdl = _q(self.mdl)
+        cmd = ""
+        if not self._sim_configured:
+            cmd = (f"set_param({mdl}, 'SaveTime', 'on', 'SaveOutput', 'on', "
+                   "'SaveFormat', 'Array'); ")
+        # result stays in the MATLAB workspace as simout_
+        cmd += (f"simout_ = sim({mdl}, 'StopTime', {_q(stop_time)}, "
+                "'ReturnWorkspaceOutputs', 'on');")
+        if key is not None:
+            # save under a private name and rename, so out.mat is never
+            # seen half written
+            tmp = mat.with_name(f"out_{uuid.uuid4().hex}.mat")
+            cmd += f" save({_q(tmp)}, 'simout_'); movefile({_q(tmp)}, {_q(mat)}, 'f');"
+        self.eng.eval(cmd, nargout=0)
+        self._sim_configured = True
+        self._sim_key = key
+        if key is not None:
+            _prune_cache(keep=key)
+
+    def export_plot(self, signal, filename, encoding="image") -> Image | dict:
+        self._sync()
+        fname = filename or "result.png"    # only echoed back to the client
+        cached = None
+        if self._sim_key is not None:
+            # cached next to the result it plots; rendered once per label
+            label = hashlib.blake2b(signal.encode(), digest_size=8).hexdigest()
+            cached = CACHE_DIR / self._sim_key / f"plot_{label}.png"
+            if cached.exists():
+                return self._image(cached.read_bytes(), fname, encoding)
+            # may have been pruned since the sim by another session
+            cached.parent.mkdir(parents=True, exist_ok=True)
+
+        # Unique file per export, so concurrent sessions never share one; a
+        # cached plot is written beside its final name and renamed into place.
+        fd, tmp = tempfile.mkstemp(
+            suffix=".png", dir=cached.parent if cached else TMP_ROOT)
+        os.close(fd)
+        path = Path(tmp)
+        try:
+            # Plot straight from simout_ inside MATLAB (simmcp_plot.m, one
+            # hidden figure reused across exports); the data never enters Python.
+            self.eng.eval(f"simmcp_plot(simout_, {_q(signal)}, {_q(path)});",
+                          nargout=0)
+            data = path.read_bytes()
+        except Exception:
+            path.unlink(missing_ok=True)
+            raise
+        if cached is not None:
+            os.replace(path, cached)
+        else:
+            path.unlink()
+        return self._image(data, fname, encoding)
+
+    @staticmethod
+    def _image(data: bytes, fname: str, encoding: str) -> Image | dict:
+        # hand the image back inline; no second fetch through a resource
+        if encoding == "image":
+            return Image(data=data, format="png")
+        return {
+            "content": base64.b64encode(data).decode(),
+            "mime_type": "image/png",
+            "encoding": "base64",
+            "filename": fname,
+        }
 
     def close(self):
-        self.eng.quit()
+        if self._starting is None:
+            return      # already closed
+        if self._eng is None:
+            # never used: hand back the engine (or its pending startup)
+            # without waiting for it or creating the model
+            release_engine(self._starting)
+            self._starting = None
+            return
+        try:
+            self._sync(rebuild=False)    # the model is discarded anyway
+        finally:
+            release_engine(self._eng)
+            self._eng = self._starting = None
+
 
+# open sessions, least recently used first; each one holds a MATLAB engine,
+# so sessions that are never closed are evicted once MAX_SESSIONS is reached
+MAX_SESSIONS = int(os.environ.get("SIMMCP_MAX_SESSIONS", "8"))
+_SESS: OrderedDict[str, SimulinkSession] = OrderedDict()
 
-_SESS: dict[str, SimulinkSession] = {}
+
+_SID_RE = re.compile(r"[0-9a-f]{6,12}")
 
 
 def _create_session() -> str:
-    sid = uuid.uuid4().hex[:8]
+    while len(_SESS) >= MAX_SESSIONS:
+        _, old = _SESS.popitem(last=False)
+        try:
+            old.close()
+        except Exception:
+            # already unregistered and its engine released (or dead);
+            # nobody is left to report to
+            pass
+    sid = sys.intern(uuid.uuid4().hex[:8])
     _SESS[sid] = SimulinkSession()
     return sid
 
 
 def _get(sid: str) -> SimulinkSession:
-    if sid not in _SESS:
+    sess = _SESS.get(sid)
+    if sess is None:
         raise ValueError("invalid session id")
-    return _SESS[sid]
+    _SESS.move_to_end(sid)
+    return sess
 
 
 class Sid(BaseModel):
-    session_id: constr(min_length=6, max_length=12)
+    session_id: str
+
+    @field_validator("session_id")
+    @classmethod
+    def _check_session_id(cls, v: str) -> str:
+        if not _SID_RE.fullmatch(v):
+            raise ValueError("session_id must be 6-12 lowercase hex characters")
+        return sys.intern(v)
 
 
 class BlockArgs(Sid):
     block_path: str
     name: str
-    position: list[int] | None = None
+    # [left, top, right, bottom]; simmcp_add_block takes exactly four
+    position: conlist(int, min_length=4, max_length=4) | None = None
     value: str | None = None
 
 
@@ -102,6 +308,20 @@ class SimArgs(Sid):
 class ExportArgs(Sid):
     signal: str
     filename: str | None = None
+    # "image" returns MCP image content; "base64" the legacy JSON dict
+    encoding: Literal["image", "base64"] = "image"
+
+
+class BatchOp(BaseModel):
+    tool: Literal["add_block", "add_line", "set_param",
+                  "sim", "export_plot", "close_session"]
+    args: dict[str, Any]
+
+
+class BatchArgs(BaseModel):
+    ops: list[BatchOp]
+    stop_on_error: bool = True
+    max_concurrent: int = Field(1, ge=1)
 
 
 def new_model() -> str:
@@ -129,11 +349,62 @@ def sim(args: SimArgs) -> str:
     return "done"
 
 
-def export_plot(args: ExportArgs) -> str:
-    return _get(args.session_id).export_plot(args.signal, args.filename)
+def export_plot(args: ExportArgs) -> Image | dict:
+    return _get(args.session_id).export_plot(
+        args.signal, args.filename, args.encoding)
 
 
 def close_session(args: Sid) -> str:
-    _get(args.session_id).close()
-    _SESS.pop(args.session_id, None)
+    sess = _get(args.session_id)
+    # unregister first: close() may raise a queued MATLAB error
+    del _SESS[args.session_id]
+    sess.close()
     return "closed"
+
+
+_BATCH_TOOLS = {
+    "add_block": (add_block, BlockArgs),
+    "add_line": (add_line, LineArgs),
+    "set_param": (set_param, ParamArgs),
+    "sim": (sim, SimArgs),
+    "export_plot": (export_plot, ExportArgs),
+    "close_session": (close_session, Sid),
+}
+
+
+def batch_execute(args: BatchArgs) -> list[dict]:
+    """
+    Run many tool calls in one request; results come back in input order.
+    Ops on the same session always run in order; with max_concurrent > 1,
+    different sessions are driven side by side.
+    """
+    results: list[dict] = [{"tool": op.tool, "status": "skipped"}
+                           for op in args.ops]
+    failed = threading.Event()
+
+    def run(indices: list[int]):
+        for i in indices:
+            if args.stop_on_error and failed.is_set():
+                return
+            op = args.ops[i]
+            fn, model = _BATCH_TOOLS[op.tool]
+            params = op.args
+            if op.tool == "export_plot":
+                # batch results are plain JSON, so images come back as base64
+                params = {**params, "encoding": "base64"}
+            try:
+                out = fn(model.model_validate(params))
+                results[i] = {"tool": op.tool, "status": "ok", "result": out}
+            except Exception as e:
+                results[i] = {"tool": op.tool, "status": "error", "error": str(e)}
+                failed.set()
+
+    if args.max_concurrent == 1:
+        run(list(range(len(args.ops))))
+    else:
+        groups: dict[Any, list[int]] = {}
+        for i, op in enumerate(args.ops):
+            groups.setdefault(op.args.get("session_id"), []).append(i)
+        with ThreadPoolExecutor(max_workers=args.max_concurrent) as pool:
+            list(pool.map(run, groups.values()))
+    return results
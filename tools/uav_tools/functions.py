@@ -1,26 +1,85 @@
 # Python interface to MATLAB UAV scenario functions via MATLAB Engine API
 
 import matlab.engine
-import numpy as np
-import ast
+from tools._engine import (HELPER_DIR, discard_engine, get_engine, release_engine,
+                           resolve, warm_pool)
+
+warm_pool()
+
+# background statements allowed in flight before submit() waits for them
+MAX_PENDING = 16
 
 
 class MATLABSession:
-    def __init__(self):
-        self.eng = matlab.engine.start_matlab(
-            "-nosplash")
-        self.eng.desktop(nargout=0)
+    def __init__(self, desktop=True):
+        # warm engine from the shared pool, or a FutureResult still starting;
+        # the first use of .eng waits for it
+        self._starting = get_engine()
+        self._eng = None
+        self._desktop = desktop
+        # statements sent with background=True; MATLAB runs them in order
+        self._pending = []
+
+    @property
+    def eng(self):
+        if self._eng is None:
+            self._eng = resolve(self._starting)
+            self._eng.addpath(str(HELPER_DIR), nargout=0)
+            if self._desktop:
+                self._eng.desktop(nargout=0)
+        return self._eng
+
+    def submit(self, cmd):
+        """
+        Send a statement whose result is not needed right away. Raises the
+        error of an earlier statement that has failed since.
+        """
+        # drop finished statements, oldest first; result() raises on failure
+        while self._pending and self._pending[0].done():
+            self._pending.pop(0).result()
+        self._pending.append(self.eng.eval(cmd, nargout=0, background=True))
+        if len(self._pending) > MAX_PENDING:
+            self.sync()
+
+    def sync(self):
+        """Wait for submitted statements; re-raises the first MATLAB error."""
+        pending, self._pending = self._pending, []
+        for fut in pending:
+            fut.result()
 
     def close(self):
-        self.eng.quit()
+        if self._starting is None:
+            return      # already closed
+        if self._eng is None:
+            # never used: hand back the engine (or its pending startup)
+            # without waiting for it or opening the desktop
+            release_engine(self._starting)
+            self._starting = None
+            return
+        try:
+            self.sync()
+        finally:
+            # an engine with the desktop open is not handed to other sessions
+            if self._desktop:
+                discard_engine(self._eng)
+            else:
+                release_engine(self._eng)
+            self._eng = self._starting = None
 
 
 _SESS: dict[str, MATLABSession] = {}
 
 
-def _create_session() -> str:
+def _create_session(desktop=True) -> str:
     sid = 0
-    _SESS[sid] = MATLABSession()
+    old = _SESS.pop(sid, None)
+    if old is not None:
+        # replaced: give its engine back rather than leaking it
+        try:
+            old.close()
+        except Exception:
+            pass
+    _SESS[sid] = MATLABSession(desktop)
     return sid
 
 
@@ -30,12 +89,22 @@ def _get(sid: str) -> MATLABSession:
     return _SESS[sid]
 
 
-def start_matlab_engine():
-    """Starts a MATLAB engine session."""
-    return _create_session()
+def start_matlab_engine(desktop=True):
+    """
+    Starts a MATLAB engine session. Returns immediately; MATLAB finishes
+    starting in the background and the first scenario call waits for it.
+    Args:
+        desktop: Open the MATLAB desktop. Pass False for headless use.
+    """
+    return _create_session(desktop)
+
+
+def _mat(rows) -> str:
+    """Render a list of rows as a MATLAB matrix literal, row by row."""
+    return "[" + "; ".join(" ".join(repr(float(v)) for v in row) for row in rows) + "]"
 
 
-def create_uav_scenario(reference_location, update_rate):
+def create_uav_scenario(reference_location: list[float], update_rate: float):
     """
     Create a uavScenario in MATLAB and store it in the workspace.
     Args:
@@ -45,8 +114,6 @@ def create_uav_scenario(reference_location, update_rate):
         Creates a MATLAB workspace variable named 'scene' containing the uavScenario object.
     """
     eng = _get(0).eng
-    reference_location = ast.literal_eval(reference_location)
-    reference_location = np.array(reference_location)
     eng.workspace['refLoc'] = matlab.double(reference_location)
     eng.workspace['updateRate'] = float(update_rate)
     eng.eval(
@@ -87,8 +154,8 @@ def add_mesh(mesh_type, name, color, xLimits=[-200, 200], yLimits=[-150, 150]):
         color = [0.6431, 0.8706, 0.6275]
 
     eng.workspace['geom'] = geom_cell
-    eng.eval(
-        "addMesh(scene" + f", \"{mesh_type}\", geom, {color});", nargout=0)
+    _get(0).submit(
+        "addMesh(scene" + f", \"{mesh_type}\", geom, {color});")
 
 
 def create_platform(name="UAV"):
@@ -100,6 +167,7 @@ def create_platform(name="UAV"):
         Creates a MATLAB workspace variable named 'platform' containing the uavPlatform object.
     """
     eng = _get(0).eng
+    _get(0).sync()
     scene = _get(0).eng.workspace['scene']
     eng.eval(f"platform = uavPlatform('{name}', {scene});", nargout=0)
 
@@ -116,9 +184,10 @@ def update_platform_mesh(mesh_type, size_param, color, transform_matrix):
     eng = _get(0).eng
     eng.workspace['sizeParam'] = matlab.cell2mat(matlab.double(size_param))
     eng.workspace['color'] = matlab.double(color)
-    eng.workspace['T'] = matlab.double(transform_matrix)
-    eng.eval(
-        f"updateMesh(platform, '{mesh_type}', {{sizeParam}}, color, T);", nargout=0)
+    # refill T in place instead of marshalling a new matlab.double per frame
+    _get(0).submit(
+        f"T(1:4, 1:4) = {_mat(transform_matrix)}; "
+        f"updateMesh(platform, '{mesh_type}', {{sizeParam}}, color, T);")
 
 
 def load_uav_mission(plan_file):
@@ -168,6 +237,7 @@ def show_3d_scene():
 def setup_scenario():
     """Prepares scenario for simulation."""
     eng = _get(0).eng
+    _get(0).sync()
     scene = _get(0).eng.workspace['scene']
     eng.eval(f"setup({scene});", nargout=0)
 
@@ -178,8 +248,7 @@ def advance_scenario():
     Side Effects:
         Creates or updates a MATLAB workspace variable named 'isDone' with the simulation status.
     """
-    eng = _get(0).eng
-    eng.eval(f"isDone = advance(scene);", nargout=0)
+    _get(0).submit("isDone = advance(scene);")
 
 
 def query_trajectory(time):
@@ -192,24 +261,36 @@ def query_trajectory(time):
     """
     eng = _get(0).eng
     eng.workspace['t'] = float(time)
-    eng.eval(f"motionInfo = query(trajectory, t);", nargout=0)
+    _get(0).submit("motionInfo = query(trajectory, t);")
 
 
 def move_platform(plat, motion_vector):
     """Moves the UAV platform."""
-    eng = _get(0).eng
-    eng.eval(f"move(platform, motionInfo);", nargout=0)
+    _get(0).submit("move(platform, motionInfo);")
 
 
 def update_camera_target(ax, ned_position):
     """Sets the camera target."""
-    eng = _get(0).eng
     target = [ned_position[1], ned_position[0], -ned_position[2]]
-    eng.workspace['target'] = matlab.double(target)
-    eng.eval(f"camtarget({ax}, target);", nargout=0)
+    _get(0).submit(f"target(1:3) = {_mat([target])}; camtarget({ax}, target);")
 
 
 def drawnow_limitrate():
     """Forces MATLAB graphics to update."""
-    eng = _get(0).eng
-    eng.eval("drawnow limitrate;", nargout=0)
+    _get(0).submit("drawnow limitrate;")
+
+
+def step_frame(time):
+    """
+    Runs one animation frame in a single MATLAB call (simmcp_step_frame.m):
+    advances the scene, queries the trajectory, moves the platform, points
+    the camera at it and redraws. Equivalent to advance_scenario,
+    query_trajectory, move_platform, update_camera_target and
+    drawnow_limitrate, with one round trip instead of five.
+    Args:
+        time: The time at which to query the trajectory.
+    Side Effects:
+        Updates the MATLAB workspace variable 'isDone'.
+    """
+    _get(0).submit(
+        f"isDone = simmcp_step_frame(scene, trajectory, platform, ax, {float(time)!r});")